@@ -5,8 +5,15 @@ A Model Context Protocol server for Discord with smart target resolution.
 """
 
 import asyncio
+import contextlib
+import io
+import itertools
 import os
-from typing import Any
+import re
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Optional
+import aiohttp
 import discord
 from discord.ext import commands
 from mcp.server import Server
@@ -26,421 +33,607 @@ mcp_server = Server("discord-mcp")
 
 # Initialize resolver and mention processor
 resolver = DiscordResolver(bot)
-mention_processor = MentionProcessor(bot)
+mention_processor = MentionProcessor(bot, resolver)
 
+# Index of message ID -> (channel ID, guild ID) for messages seen since startup.
+# Lets edit_message/add_reaction go straight to the right channel instead of
+# probing every channel with fetch_message.
+_MSG_INDEX_MAX = 100_000
+_msg_index: OrderedDict[int, tuple[int, int]] = OrderedDict()
 
-@mcp_server.list_tools()
-async def list_tools() -> list[Tool]:
-    """List available Discord tools."""
-    return [
-        Tool(
-            name="send_message",
-            description="Send a message to a Discord channel or user DM. Target can be a channel name, channel ID, username, or user ID. For ambiguous channel names (like 'general'), use 'ServerName/channel' format.",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "message": {
-                        "type": "string",
-                        "description": "The message content to send"
-                    },
-                    "target": {
-                        "type": "string",
-                        "description": "Channel name/ID or username/ID. Examples: 'general', 'MyServer/general', '@username', or snowflake IDs. Use 'ServerName/channel' for ambiguous channels."
-                    }
+# Maximum number of concurrent fetch_message probes when the index misses
+_FETCH_CONCURRENCY = 16
+
+# Most recent messages per channel (oldest first), kept current by gateway
+# events so read_messages can usually skip the history request entirely.
+# read_messages never asks for more than 100. discord.py's own message cache
+# is capped across all channels, so a busy channel would evict a quiet one's
+# history; channels here are kept in LRU order and capped instead.
+_RECENT_MAX = 100
+_RECENT_CHANNELS_MAX = 500
+_recent_messages: OrderedDict[int, deque[discord.Message]] = OrderedDict()
+
+
+def _index_message(msg: discord.Message):
+    """Record which channel a message lives in, evicting the oldest entry when full."""
+    _msg_index[msg.id] = (msg.channel.id, msg.guild.id if msg.guild else 0)
+    _msg_index.move_to_end(msg.id)
+    if len(_msg_index) > _MSG_INDEX_MAX:
+        _msg_index.popitem(last=False)
+
+
+def _store_recent(channel_id: int, recent: deque[discord.Message]):
+    """Store a channel's recent messages, evicting the least recently used channel when full."""
+    _recent_messages[channel_id] = recent
+    _recent_messages.move_to_end(channel_id)
+    if len(_recent_messages) > _RECENT_CHANNELS_MAX:
+        _recent_messages.popitem(last=False)
+
+
+def _append_recent(message: discord.Message):
+    """Add a newly received message to its channel's recent-message cache."""
+    recent = _recent_messages.get(message.channel.id)
+    if recent is None:
+        recent = deque(maxlen=_RECENT_MAX)
+    recent.append(message)
+    _store_recent(message.channel.id, recent)
+
+
+def _remember_history(channel_id: int, history: list[discord.Message]):
+    """
+    Seed a channel's recent-message cache from a history fetch (newest first).
+    Messages that arrived while the fetch was in flight are kept after it.
+    """
+    if not history:
+        return
+    newest_id = history[0].id
+    recent = deque(reversed(history[:_RECENT_MAX]), maxlen=_RECENT_MAX)
+    recent.extend(msg for msg in _recent_messages.get(channel_id, ()) if msg.id > newest_id)
+    _store_recent(channel_id, recent)
+
+
+def _replace_recent(message: discord.Message):
+    """Swap an edited message into its channel's recent-message cache."""
+    recent = _recent_messages.get(message.channel.id)
+    if recent:
+        for i, msg in enumerate(recent):
+            if msg.id == message.id:
+                recent[i] = message
+                break
+
+
+def _forget_recent(channel_id: int, message_id: int):
+    """Drop a deleted message from its channel's recent-message cache."""
+    recent = _recent_messages.get(channel_id)
+    if recent:
+        for msg in recent:
+            if msg.id == message_id:
+                recent.remove(msg)
+                break
+
+
+async def _find_message(message_id: int) -> Optional[discord.Message]:
+    """
+    Locate a message by ID across all accessible channels.
+    Checks the gateway message cache and the message index before falling
+    back to probing every text channel.
+    """
+    # discord.py keeps recently received messages in memory - no HTTP needed
+    cached = discord.utils.get(bot.cached_messages, id=message_id)
+    if cached:
+        return cached
+    
+    # Known channel from the index - a single fetch. Messages never move between
+    # channels, so a miss there means the message is gone (or out of reach).
+    entry = _msg_index.get(message_id)
+    if entry:
+        channel = bot.get_channel(entry[0])
+        if channel:
+            try:
+                message_obj = await channel.fetch_message(message_id)
+            except (discord.NotFound, discord.Forbidden):
+                # May already have been dropped by a concurrent lookup or eviction
+                _msg_index.pop(message_id, None)
+                return None
+            _index_message(message_obj)
+            return message_obj
+        _msg_index.pop(message_id, None)
+    
+    # Cache miss - probe every channel concurrently, stopping at the first hit
+    channels = [channel for guild in bot.guilds for channel in guild.text_channels]
+    sem = asyncio.Semaphore(_FETCH_CONCURRENCY)
+    
+    async def try_channel(channel):
+        async with sem:
+            try:
+                return await channel.fetch_message(message_id)
+            except (discord.NotFound, discord.Forbidden):
+                # Not in this channel, or no access to it
+                return None
+    
+    tasks = [asyncio.create_task(try_channel(channel)) for channel in channels]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            message_obj = await next_done
+            if message_obj:
+                _index_message(message_obj)
+                return message_obj
+    finally:
+        for task in tasks:
+            task.cancel()
+    
+    return None
+
+
+# Tool definitions never change, so build them once at import time
+_TOOLS: list[Tool] = [
+    Tool(
+        name="send_message",
+        description="Send a message to a Discord channel or user DM. Target can be a channel name, channel ID, username, or user ID. For ambiguous channel names (like 'general'), use 'ServerName/channel' format.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "message": {
+                    "type": "string",
+                    "description": "The message content to send"
                 },
-                "required": ["message", "target"]
-            }
-        ),
-        Tool(
-            name="edit_message",
-            description="Edit or delete a message. If message is empty/blank, the message will be deleted. Message ID must be exact.",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "message_id": {
-                        "type": "string",
-                        "description": "The ID of the message to edit/delete"
-                    },
-                    "message": {
-                        "type": "string",
-                        "description": "New message content. Leave empty to delete the message."
-                    }
+                "target": {
+                    "type": "string",
+                    "description": "Channel name/ID or username/ID. Examples: 'general', 'MyServer/general', '@username', or snowflake IDs. Use 'ServerName/channel' for ambiguous channels."
+                }
+            },
+            "required": ["message", "target"]
+        }
+    ),
+    Tool(
+        name="edit_message",
+        description="Edit or delete a message. If message is empty/blank, the message will be deleted. Message ID must be exact.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "message_id": {
+                    "type": "string",
+                    "description": "The ID of the message to edit/delete"
                 },
-                "required": ["message_id"]
-            }
-        ),
-        Tool(
-            name="read_messages",
-            description="Read recent messages from a channel. Returns channel info and message history. Channel can be name or ID. For ambiguous names, use 'ServerName/channel' format.",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "channel": {
-                        "type": "string",
-                        "description": "Channel name or ID. Examples: 'general', 'MyServer/general', or snowflake ID. Use 'ServerName/channel' for ambiguous channels."
-                    },
-                    "limit": {
-                        "type": "number",
-                        "description": "Maximum number of messages to retrieve (default: 50, max: 100)",
-                        "default": 50
-                    }
+                "message": {
+                    "type": "string",
+                    "description": "New message content. Leave empty to delete the message."
+                }
+            },
+            "required": ["message_id"]
+        }
+    ),
+    Tool(
+        name="read_messages",
+        description="Read recent messages from a channel. Returns channel info and message history. Channel can be name or ID. For ambiguous names, use 'ServerName/channel' format.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "channel": {
+                    "type": "string",
+                    "description": "Channel name or ID. Examples: 'general', 'MyServer/general', or snowflake ID. Use 'ServerName/channel' for ambiguous channels."
                 },
-                "required": ["channel"]
-            }
-        ),
-        Tool(
-            name="list_servers",
-            description="List all Discord servers (guilds) the bot has access to.",
-            inputSchema={
-                "type": "object",
-                "properties": {},
-                "required": []
-            }
-        ),
-        Tool(
-            name="list_channels",
-            description="List all channels in a specific server. Server can be name or ID.",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "server": {
-                        "type": "string",
-                        "description": "Server name or ID"
-                    }
+                "limit": {
+                    "type": "number",
+                    "description": "Maximum number of messages to retrieve (default: 50, max: 100)",
+                    "default": 50
+                }
+            },
+            "required": ["channel"]
+        }
+    ),
+    Tool(
+        name="list_servers",
+        description="List all Discord servers (guilds) the bot has access to.",
+        inputSchema={
+            "type": "object",
+            "properties": {},
+            "required": []
+        }
+    ),
+    Tool(
+        name="list_channels",
+        description="List all channels in a specific server. Server can be name or ID.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "server": {
+                    "type": "string",
+                    "description": "Server name or ID"
+                }
+            },
+            "required": ["server"]
+        }
+    ),
+    Tool(
+        name="search_messages",
+        description="Search for messages containing specific text in a channel. Channel can be name or ID. For ambiguous names, use 'ServerName/channel' format.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "channel": {
+                    "type": "string",
+                    "description": "Channel name or ID. Examples: 'general', 'MyServer/general', or snowflake ID"
                 },
-                "required": ["server"]
-            }
-        ),
-        Tool(
-            name="search_messages",
-            description="Search for messages containing specific text in a channel. Channel can be name or ID. For ambiguous names, use 'ServerName/channel' format.",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "channel": {
-                        "type": "string",
-                        "description": "Channel name or ID. Examples: 'general', 'MyServer/general', or snowflake ID"
-                    },
-                    "query": {
-                        "type": "string",
-                        "description": "Search query text"
-                    },
-                    "limit": {
-                        "type": "number",
-                        "description": "Maximum number of messages to search through (default: 100)",
-                        "default": 100
-                    }
+                "query": {
+                    "type": "string",
+                    "description": "Search query text"
                 },
-                "required": ["channel", "query"]
-            }
-        ),
-        Tool(
-            name="add_reaction",
-            description="Add a reaction emoji to a message. Message ID must be exact.",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "message_id": {
-                        "type": "string",
-                        "description": "The ID of the message to react to"
-                    },
-                    "emoji": {
-                        "type": "string",
-                        "description": "Emoji to react with (Unicode emoji or custom emoji name)"
-                    }
+                "limit": {
+                    "type": "number",
+                    "description": "Maximum number of messages to search through (default: 100)",
+                    "default": 100
+                }
+            },
+            "required": ["channel", "query"]
+        }
+    ),
+    Tool(
+        name="add_reaction",
+        description="Add a reaction emoji to a message. Message ID must be exact.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "message_id": {
+                    "type": "string",
+                    "description": "The ID of the message to react to"
                 },
-                "required": ["message_id", "emoji"]
-            }
-        )
-    ]
+                "emoji": {
+                    "type": "string",
+                    "description": "Emoji to react with (Unicode emoji or custom emoji name)"
+                }
+            },
+            "required": ["message_id", "emoji"]
+        }
+    )
+]
 
 
-@mcp_server.call_tool()
-async def call_tool(name: str, arguments: Any) -> list[TextContent]:
-    """Handle tool calls."""
+@mcp_server.list_tools()
+async def list_tools() -> list[Tool]:
+    """List available Discord tools."""
+    return _TOOLS
+
+
+def _clamp_limit(value: Any, default: int, maximum: int) -> int:
+    """Coerce a tool's limit argument to an int in [1, maximum], treating None as the default."""
+    value = default if value is None else int(value)
+    return maximum if value > maximum else (1 if value < 1 else value)
+
+
+def _format_messages(entries: list[tuple[datetime, str, str, int]]) -> str:
+    """
+    Format (created_at, author name, content, message ID) history entries,
+    given newest first, into a single string with the oldest message first.
+    Pure string work with no Discord objects, so it can run off the event loop.
+    """
+    # isoformat avoids strftime's format-string parsing; [:19] drops the UTC offset
+    return "\n".join(
+        f"[{created_at.isoformat(sep=' ', timespec='seconds')[:19]}] {author}: {content}\n"
+        f"  (ID: {message_id})\n"
+        for created_at, author, content, message_id in reversed(entries)
+    )
+
+
+async def _tool_send_message(arguments: Any) -> list[TextContent]:
+    """Send a message to a channel or user DM."""
+    message_text = arguments["message"]
+    target = arguments["target"]
     
-    try:
-        if name == "send_message":
-            message_text = arguments["message"]
-            target = arguments["target"]
-            
-            # Parse server/channel format
-            server_part, target_part = resolver.parse_target(target)
-            guild = None
-            
-            if server_part:
-                guild, error = await resolver.resolve_server(server_part)
-                if not guild:
-                    return [TextContent(type="text", text=error)]
-            
-            # Check if target_part is actually a server name (when no "/" was used)
-            # This catches cases like "OpenWAI server" where user meant the server but didn't specify a channel
-            if not server_part:
-                # Try to resolve as server first to give a better error
-                test_guild, _ = await resolver.resolve_server(target_part)
-                if test_guild:
-                    # It's a valid server name but no channel specified!
-                    # List available channels to help the user
-                    channels = []
-                    for channel in test_guild.text_channels:
-                        channels.append(f"  • #{channel.name}")
-                    
-                    channel_list = "\n".join(channels[:10])  # Show first 10
-                    if len(test_guild.text_channels) > 10:
-                        channel_list += f"\n  ... and {len(test_guild.text_channels) - 10} more"
-                    
-                    return [TextContent(
-                        type="text",
-                        text=f"ERROR: Found server '{test_guild.name}' but no channel was specified.\n\n"
-                             f"Please specify which channel to send to using format: '{test_guild.name}/channel_name'\n\n"
-                             f"Available channels in {test_guild.name}:\n{channel_list}\n\n"
-                             f"Example: '{test_guild.name}/general'"
-                    )]
-            
-            # Try as channel first
-            channel, error = await resolver.resolve_channel(target_part, guild)
-            if channel:
-                # Process mentions in the message
-                processed_message = await mention_processor.process_mentions(message_text, channel.guild)
-                sent_msg = await channel.send(processed_message)
-                return [TextContent(
-                    type="text",
-                    text=f"Message sent to #{channel.name} in {channel.guild.name} (Message ID: {sent_msg.id})"
-                )]
-            
-            # If channel lookup failed with ambiguity error, return it
-            if error and "Multiple channels" in error:
-                return [TextContent(type="text", text=error)]
-            
-            # Try as user DM
-            user, user_error = await resolver.resolve_user(target_part)
-            if user:
-                # Process mentions in the message (though less common in DMs)
-                processed_message = await mention_processor.process_mentions(message_text)
-                sent_msg = await user.send(processed_message)
-                return [TextContent(
-                    type="text",
-                    text=f"DM sent to {user.name} (Message ID: {sent_msg.id})"
-                )]
-            
-            # Provide combined error message
-            combined_error = f"ERROR: Could not find channel or user '{target}'.\n\n"
-            if error:
-                combined_error += f"Channel lookup failed: {error}\n\n"
-            if user_error:
-                combined_error += f"User lookup failed: {user_error}"
-            
-            return [TextContent(type="text", text=combined_error)]
-        
-        elif name == "edit_message":
-            message_id_str = arguments["message_id"]
-            new_content = arguments.get("message", "")
-            
-            # Validate message ID format
-            if not resolver.is_snowflake(message_id_str):
-                return [TextContent(
-                    type="text",
-                    text=f"ERROR: '{message_id_str}' is not a valid message ID. Message IDs must be 17-20 digit numbers."
-                )]
-            
-            message_id = int(message_id_str)
-            
-            # Search for message in all accessible channels
-            message_obj = None
-            for guild in bot.guilds:
-                for channel in guild.text_channels:
-                    try:
-                        message_obj = await channel.fetch_message(message_id)
-                        break
-                    except:
-                        continue
-                if message_obj:
-                    break
-            
-            if not message_obj:
-                return [TextContent(
-                    type="text",
-                    text=f"ERROR: Could not find message with ID {message_id}. The message may have been deleted, or the bot doesn't have access to the channel containing this message."
-                )]
-            
-            # Delete if empty, edit otherwise
-            if not new_content or new_content.strip() == "":
-                await message_obj.delete()
-                return [TextContent(
-                    type="text",
-                    text=f"Message {message_id} deleted successfully from #{message_obj.channel.name}"
-                )]
-            else:
-                # Process mentions in the new content
-                processed_content = await mention_processor.process_mentions(new_content, message_obj.guild)
-                await message_obj.edit(content=processed_content)
-                return [TextContent(
-                    type="text",
-                    text=f"Message {message_id} edited successfully in #{message_obj.channel.name}"
-                )]
-        
-        elif name == "read_messages":
-            channel_input = arguments["channel"]
-            limit = min(int(arguments.get("limit", 50)), 100)
-            
-            # Parse server/channel format
-            server_part, target_part = resolver.parse_target(channel_input)
-            guild = None
-            
-            if server_part:
-                guild, error = await resolver.resolve_server(server_part)
-                if not guild:
-                    return [TextContent(type="text", text=error)]
-            
-            channel, error = await resolver.resolve_channel(target_part, guild)
-            if not channel:
-                return [TextContent(type="text", text=error)]
-            
-            # Get channel info
-            info = f"Channel: #{channel.name} (ID: {channel.id})\n"
-            info += f"Type: {channel.type}\n"
-            if channel.topic:
-                info += f"Topic: {channel.topic}\n"
-            info += f"Server: {channel.guild.name}\n\n"
-            info += "=" * 50 + "\n\n"
-            
-            # Get messages
-            messages = []
-            async for msg in channel.history(limit=limit):
-                timestamp = msg.created_at.strftime("%Y-%m-%d %H:%M:%S")
-                # Convert Discord mentions to readable @username format
-                content = await mention_processor.humanize_mentions(msg.content)
-                messages.append(
-                    f"[{timestamp}] {msg.author.name}: {content}\n"
-                    f"  (ID: {msg.id})\n"
-                )
-            
-            messages.reverse()  # Show oldest first
-            info += "\n".join(messages)
-            
-            return [TextContent(type="text", text=info)]
-        
-        elif name == "list_servers":
-            servers = []
-            for guild in bot.guilds:
-                servers.append(
-                    f"• {guild.name}\n"
-                    f"  ID: {guild.id}\n"
-                    f"  Members: {guild.member_count}\n"
-                )
-            
-            result = f"Connected to {len(bot.guilds)} servers:\n\n" + "\n".join(servers)
-            return [TextContent(type="text", text=result)]
-        
-        elif name == "list_channels":
-            server_input = arguments["server"]
-            guild, error = await resolver.resolve_server(server_input)
-            
-            if not guild:
-                return [TextContent(type="text", text=error)]
-            
+    # Parse server/channel format
+    server_part, target_part = resolver.parse_target(target)
+    guild = None
+    
+    if server_part:
+        guild, error = await resolver.resolve_server(server_part)
+        if not guild:
+            return [TextContent(type="text", text=error)]
+    
+    # Check if target_part is actually a server name (when no "/" was used)
+    # This catches cases like "OpenWAI server" where user meant the server but didn't specify a channel
+    if not server_part:
+        # Try to resolve as server first to give a better error
+        test_guild, _ = await resolver.resolve_server(target_part)
+        if test_guild:
+            # It's a valid server name but no channel specified!
+            # List available channels to help the user
             channels = []
-            for channel in guild.channels:
-                if isinstance(channel, discord.TextChannel):
-                    channels.append(f"  • #{channel.name} (text) - ID: {channel.id}")
-                elif isinstance(channel, discord.VoiceChannel):
-                    channels.append(f"  • 🔊 {channel.name} (voice) - ID: {channel.id}")
-                elif isinstance(channel, discord.ForumChannel):
-                    channels.append(f"  • 💬 {channel.name} (forum) - ID: {channel.id}")
+            for channel in test_guild.text_channels:
+                channels.append(f"  • #{channel.name}")
             
-            result = f"Channels in {guild.name}:\n\n" + "\n".join(channels)
-            return [TextContent(type="text", text=result)]
-        
-        elif name == "search_messages":
-            channel_input = arguments["channel"]
-            query = arguments["query"].lower()
-            limit = min(int(arguments.get("limit", 100)), 500)
+            channel_list = "\n".join(channels[:10])  # Show first 10
+            if len(test_guild.text_channels) > 10:
+                channel_list += f"\n  ... and {len(test_guild.text_channels) - 10} more"
             
-            # Parse server/channel format
-            server_part, target_part = resolver.parse_target(channel_input)
-            guild = None
-            
-            if server_part:
-                guild, error = await resolver.resolve_server(server_part)
-                if not guild:
-                    return [TextContent(type="text", text=error)]
-            
-            channel, error = await resolver.resolve_channel(target_part, guild)
-            if not channel:
-                return [TextContent(type="text", text=error)]
-            
-            results = []
-            async for msg in channel.history(limit=limit):
-                if query in msg.content.lower():
-                    timestamp = msg.created_at.strftime("%Y-%m-%d %H:%M:%S")
-                    # Convert Discord mentions to readable @username format
-                    content = await mention_processor.humanize_mentions(msg.content)
-                    results.append(
-                        f"[{timestamp}] {msg.author.name}: {content}\n"
-                        f"  (ID: {msg.id})\n"
-                    )
-            
-            if not results:
-                return [TextContent(
-                    type="text",
-                    text=f"No messages found containing '{query}' in #{channel.name}"
-                )]
-            
-            results.reverse()
-            result = f"Found {len(results)} messages containing '{query}' in #{channel.name}:\n\n"
-            result += "\n".join(results)
-            
-            return [TextContent(type="text", text=result)]
-        
-        elif name == "add_reaction":
-            message_id_str = arguments["message_id"]
-            emoji = arguments["emoji"]
-            
-            # Validate message ID format
-            if not resolver.is_snowflake(message_id_str):
-                return [TextContent(
-                    type="text",
-                    text=f"ERROR: '{message_id_str}' is not a valid message ID. Message IDs must be 17-20 digit numbers."
-                )]
-            
-            message_id = int(message_id_str)
-            
-            # Search for message
-            message_obj = None
-            for guild in bot.guilds:
-                for channel in guild.text_channels:
-                    try:
-                        message_obj = await channel.fetch_message(message_id)
-                        break
-                    except:
-                        continue
-                if message_obj:
-                    break
-            
-            if not message_obj:
-                return [TextContent(
-                    type="text",
-                    text=f"ERROR: Could not find message with ID {message_id}. The message may have been deleted, or the bot doesn't have access to the channel containing this message."
-                )]
-            
-            try:
-                await message_obj.add_reaction(emoji)
-                return [TextContent(
-                    type="text",
-                    text=f"Added reaction {emoji} to message {message_id} in #{message_obj.channel.name}"
-                )]
-            except discord.HTTPException as e:
-                return [TextContent(
-                    type="text",
-                    text=f"ERROR: Could not add reaction '{emoji}'. The emoji may be invalid or the bot may not have permission to react. Discord error: {str(e)}"
-                )]
-        
-        else:
             return [TextContent(
                 type="text",
-                text=f"Unknown tool: {name}"
+                text=f"ERROR: Found server '{test_guild.name}' but no channel was specified.\n\n"
+                     f"Please specify which channel to send to using format: '{test_guild.name}/channel_name'\n\n"
+                     f"Available channels in {test_guild.name}:\n{channel_list}\n\n"
+                     f"Example: '{test_guild.name}/general'"
             )]
     
+    # Try as channel first
+    channel, error = await resolver.resolve_channel(target_part, guild)
+    if channel:
+        # Process mentions in the message
+        processed_message = await mention_processor.process_mentions(message_text, channel.guild)
+        sent_msg = await channel.send(processed_message)
+        return [TextContent(
+            type="text",
+            text=f"Message sent to #{channel.name} in {channel.guild.name} (Message ID: {sent_msg.id})"
+        )]
+    
+    # If channel lookup failed with ambiguity error, return it
+    if error and "Multiple channels" in error:
+        return [TextContent(type="text", text=error)]
+    
+    # Try as user DM
+    user, user_error = await resolver.resolve_user(target_part)
+    if user:
+        # Process mentions in the message (though less common in DMs)
+        processed_message = await mention_processor.process_mentions(message_text)
+        sent_msg = await user.send(processed_message)
+        return [TextContent(
+            type="text",
+            text=f"DM sent to {user.name} (Message ID: {sent_msg.id})"
+        )]
+    
+    # Provide combined error message
+    combined_error = f"ERROR: Could not find channel or user '{target}'.\n\n"
+    if error:
+        combined_error += f"Channel lookup failed: {error}\n\n"
+    if user_error:
+        combined_error += f"User lookup failed: {user_error}"
+    
+    return [TextContent(type="text", text=combined_error)]
+
+
+async def _tool_edit_message(arguments: Any) -> list[TextContent]:
+    """Edit or delete a message."""
+    message_id_str = arguments["message_id"]
+    new_content = arguments.get("message", "")
+    
+    # Validate message ID format
+    if not resolver.is_snowflake(message_id_str):
+        return [TextContent(
+            type="text",
+            text=f"ERROR: '{message_id_str}' is not a valid message ID. Message IDs must be 17-20 digit numbers."
+        )]
+    
+    message_id = int(message_id_str)
+    
+    # Search for message in all accessible channels
+    message_obj = await _find_message(message_id)
+    
+    if not message_obj:
+        return [TextContent(
+            type="text",
+            text=f"ERROR: Could not find message with ID {message_id}. The message may have been deleted, or the bot doesn't have access to the channel containing this message."
+        )]
+    
+    # Delete if empty, edit otherwise
+    if not new_content or new_content.strip() == "":
+        await message_obj.delete()
+        return [TextContent(
+            type="text",
+            text=f"Message {message_id} deleted successfully from #{message_obj.channel.name}"
+        )]
+    else:
+        # Process mentions in the new content
+        processed_content = await mention_processor.process_mentions(new_content, message_obj.guild)
+        await message_obj.edit(content=processed_content)
+        return [TextContent(
+            type="text",
+            text=f"Message {message_id} edited successfully in #{message_obj.channel.name}"
+        )]
+
+
+# Divider between channel info and message history in read_messages
+_SEPARATOR = "=" * 50
+
+
+async def _tool_read_messages(arguments: Any) -> list[TextContent]:
+    """Read recent messages from a channel."""
+    channel_input = arguments["channel"]
+    limit = _clamp_limit(arguments.get("limit"), 50, 100)
+    
+    # Parse server/channel format
+    server_part, target_part = resolver.parse_target(channel_input)
+    guild = None
+    
+    if server_part:
+        guild, error = await resolver.resolve_server(server_part)
+        if not guild:
+            return [TextContent(type="text", text=error)]
+    
+    channel, error = await resolver.resolve_channel(target_part, guild)
+    if not channel:
+        return [TextContent(type="text", text=error)]
+    
+    # Get channel info
+    parts = [
+        f"Channel: #{channel.name} (ID: {channel.id})\n",
+        f"Type: {channel.type}\n"
+    ]
+    if channel.topic:
+        parts.append(f"Topic: {channel.topic}\n")
+    parts.append(f"Server: {channel.guild.name}\n\n{_SEPARATOR}\n\n")
+    
+    # Get messages, then convert Discord mentions to readable @username format
+    # for all of them concurrently
+    recent = _recent_messages.get(channel.id)
+    if recent and limit <= len(recent):
+        _recent_messages.move_to_end(channel.id)
+        history = list(itertools.islice(reversed(recent), limit))
+    else:
+        history = [msg async for msg in channel.history(limit=limit)]
+        _remember_history(channel.id, history)
+    await mention_processor.bulk_prefetch([msg.content for msg in history], channel.guild)
+    contents = await asyncio.gather(*(mention_processor.humanize_mentions(msg.content, channel.guild) for msg in history))
+    entries = [(msg.created_at, msg.author.name, content, msg.id) for msg, content in zip(history, contents)]
+    
+    # Formatting up to 100 messages is CPU work - keep it off the event loop
+    parts.append(await asyncio.to_thread(_format_messages, entries))
+    
+    return [TextContent(type="text", text="".join(parts))]
+
+
+async def _tool_list_servers(arguments: Any) -> list[TextContent]:
+    """List all servers the bot has access to."""
+    buf = io.StringIO()
+    buf.write(f"Connected to {len(bot.guilds)} servers:\n\n")
+    for i, guild in enumerate(bot.guilds):
+        if i:
+            buf.write("\n")
+        buf.write(
+            f"• {guild.name}\n"
+            f"  ID: {guild.id}\n"
+            f"  Members: {guild.member_count}\n"
+        )
+    
+    return [TextContent(type="text", text=buf.getvalue())]
+
+
+# Channel type -> (line prefix, kind label) for list_channels
+_CHANNEL_FORMATS = {
+    discord.TextChannel: ("  • #", "(text)"),
+    discord.VoiceChannel: ("  • 🔊 ", "(voice)"),
+    discord.ForumChannel: ("  • 💬 ", "(forum)"),
+}
+
+
+async def _tool_list_channels(arguments: Any) -> list[TextContent]:
+    """List all channels in a server."""
+    server_input = arguments["server"]
+    guild, error = await resolver.resolve_server(server_input)
+    
+    if not guild:
+        return [TextContent(type="text", text=error)]
+    
+    buf = io.StringIO()
+    buf.write(f"Channels in {guild.name}:\n\n")
+    sep = ""
+    for channel in guild.channels:
+        fmt = _CHANNEL_FORMATS.get(type(channel))
+        if fmt is None:
+            continue
+        prefix, kind = fmt
+        buf.write(f"{sep}{prefix}{channel.name} {kind} - ID: {channel.id}")
+        sep = "\n"
+    
+    return [TextContent(type="text", text=buf.getvalue())]
+
+
+async def _tool_search_messages(arguments: Any) -> list[TextContent]:
+    """Search for messages containing text in a channel."""
+    channel_input = arguments["channel"]
+    query = arguments["query"]
+    # Case-insensitive match without lowering every message
+    query_re = re.compile(re.escape(query), re.IGNORECASE)
+    limit = _clamp_limit(arguments.get("limit"), 100, 500)
+    
+    # Parse server/channel format
+    server_part, target_part = resolver.parse_target(channel_input)
+    guild = None
+    
+    if server_part:
+        guild, error = await resolver.resolve_server(server_part)
+        if not guild:
+            return [TextContent(type="text", text=error)]
+    
+    channel, error = await resolver.resolve_channel(target_part, guild)
+    if not channel:
+        return [TextContent(type="text", text=error)]
+    
+    # Collect matches first, then convert Discord mentions to readable
+    # @username format for all of them concurrently
+    matches = [msg async for msg in channel.history(limit=limit) if query_re.search(msg.content)]
+    if not matches:
+        return [TextContent(
+            type="text",
+            text=f"No messages found containing '{query}' in #{channel.name}"
+        )]
+    
+    await mention_processor.bulk_prefetch([msg.content for msg in matches], channel.guild)
+    contents = await asyncio.gather(*(mention_processor.humanize_mentions(msg.content, channel.guild) for msg in matches))
+    entries = [(msg.created_at, msg.author.name, content, msg.id) for msg, content in zip(matches, contents)]
+    result = f"Found {len(matches)} messages containing '{query}' in #{channel.name}:\n\n"
+    result += await asyncio.to_thread(_format_messages, entries)
+    
+    return [TextContent(type="text", text=result)]
+
+
+async def _tool_add_reaction(arguments: Any) -> list[TextContent]:
+    """Add a reaction emoji to a message."""
+    message_id_str = arguments["message_id"]
+    emoji = arguments["emoji"]
+    
+    # Validate message ID format
+    if not resolver.is_snowflake(message_id_str):
+        return [TextContent(
+            type="text",
+            text=f"ERROR: '{message_id_str}' is not a valid message ID. Message IDs must be 17-20 digit numbers."
+        )]
+    
+    message_id = int(message_id_str)
+    
+    # Search for message
+    message_obj = await _find_message(message_id)
+    
+    if not message_obj:
+        return [TextContent(
+            type="text",
+            text=f"ERROR: Could not find message with ID {message_id}. The message may have been deleted, or the bot doesn't have access to the channel containing this message."
+        )]
+    
+    try:
+        await message_obj.add_reaction(emoji)
+        return [TextContent(
+            type="text",
+            text=f"Added reaction {emoji} to message {message_id} in #{message_obj.channel.name}"
+        )]
+    except discord.HTTPException as e:
+        return [TextContent(
+            type="text",
+            text=f"ERROR: Could not add reaction '{emoji}'. The emoji may be invalid or the bot may not have permission to react. Discord error: {str(e)}"
+        )]
+
+
+_HANDLERS: dict[str, Callable[[Any], Awaitable[list[TextContent]]]] = {
+    "send_message": _tool_send_message,
+    "edit_message": _tool_edit_message,
+    "read_messages": _tool_read_messages,
+    "list_servers": _tool_list_servers,
+    "list_channels": _tool_list_channels,
+    "search_messages": _tool_search_messages,
+    "add_reaction": _tool_add_reaction,
+}
+
+
+# Bound concurrent tool calls so a burst of requests can't flood Discord's
+# rate limits. History-scanning tools get tighter per-tool limits on top.
+_TOOL_SEM = asyncio.Semaphore(16)
+_TOOL_SEMS = {
+    "search_messages": asyncio.Semaphore(4),
+    "read_messages": asyncio.Semaphore(8),
+}
+
+
+@mcp_server.call_tool()
+async def call_tool(name: str, arguments: Any) -> list[TextContent]:
+    """Handle tool calls."""
+    handler = _HANDLERS.get(name)
+    if handler is None:
+        return [TextContent(
+            type="text",
+            text=f"Unknown tool: {name}"
+        )]
+    
+    try:
+        # Take the per-tool slot first so queued scans don't hold global slots
+        async with _TOOL_SEMS.get(name, contextlib.nullcontext()), _TOOL_SEM:
+            return await handler(arguments)
     except Exception as e:
         return [TextContent(
             type="text",
@@ -453,6 +646,114 @@ async def on_ready():
     """Called when the bot is ready."""
     print(f"Discord bot logged in as {bot.user}")
     print(f"Connected to {len(bot.guilds)} servers")
+    resolver.build_index()
+    # on_ready also fires after a fresh (non-resumed) gateway session, and
+    # messages sent while disconnected never reached on_message, so the
+    # recent-message deques may have gaps. The message index stays valid -
+    # missed messages only cause index misses, which fall back safely.
+    _recent_messages.clear()
+
+
+@bot.event
+async def on_user_update(before, after):
+    """Keep the user name index and humanized mention names current when users rename."""
+    resolver.remove_user(before)
+    resolver.add_user(after)
+    mention_processor.remember_user(after)
+
+
+@bot.event
+async def on_member_join(member):
+    """Index new members by name."""
+    resolver.add_user(member)
+
+
+@bot.event
+async def on_member_remove(member):
+    """Forget members who are no longer in any shared server."""
+    resolver.remove_member(member)
+
+
+@bot.event
+async def on_guild_join(guild):
+    """Index channels of newly joined servers."""
+    resolver.add_guild(guild)
+
+
+@bot.event
+async def on_guild_available(guild):
+    """Re-index a server that came back from an outage; discord.py rebuilt its channels."""
+    resolver.refresh_guild(guild)
+
+
+@bot.event
+async def on_guild_remove(guild):
+    """Forget channels of servers the bot left."""
+    resolver.remove_guild(guild)
+
+
+@bot.event
+async def on_guild_update(before, after):
+    """Re-index a server when it is renamed."""
+    if before.name != after.name:
+        resolver.rename_guild(before, after)
+
+
+@bot.event
+async def on_guild_channel_create(channel):
+    """Index newly created channels."""
+    resolver.add_channel(channel)
+
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    """Forget deleted channels."""
+    resolver.remove_channel(channel)
+
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    """Re-index a channel when it is renamed."""
+    if before.name != after.name:
+        resolver.remove_channel(before)
+        resolver.add_channel(after)
+
+
+@bot.event
+async def on_message(message):
+    """Index incoming messages so later lookups by ID are cheap."""
+    _index_message(message)
+    _append_recent(message)
+
+
+@bot.event
+async def on_message_edit(before, after):
+    """Keep the message index and recent-message cache fresh for edited messages."""
+    _index_message(after)
+    _replace_recent(after)
+
+
+@bot.event
+async def on_raw_message_edit(payload):
+    """
+    Edits to messages outside discord.py's message cache (e.g. ones seeded from
+    history) can't be patched in place, so drop that channel's recent cache.
+    """
+    if payload.cached_message is None:
+        _recent_messages.pop(payload.channel_id, None)
+
+
+@bot.event
+async def on_raw_message_delete(payload):
+    """Stop serving deleted messages from the recent-message cache."""
+    _forget_recent(payload.channel_id, payload.message_id)
+
+
+@bot.event
+async def on_raw_bulk_message_delete(payload):
+    """Stop serving bulk-deleted messages from the recent-message cache."""
+    for message_id in payload.message_ids:
+        _forget_recent(payload.channel_id, message_id)
 
 
 async def main():
@@ -462,6 +763,17 @@ async def main():
     if not token:
         raise ValueError("DISCORD_BOT_TOKEN or DISCORD_TOKEN environment variable not set")
     
+    # Tuned connection pool for discord.py's HTTP client. The connector has to be
+    # created inside the running loop, so it is handed to the bot here rather than
+    # at construction; the session discord.py creates on login picks it up.
+    connector = aiohttp.TCPConnector(
+        limit=256,
+        limit_per_host=64,
+        ttl_dns_cache=300,
+        keepalive_timeout=75
+    )
+    bot.http.connector = connector
+    
     async def start_bot():
         """Start the Discord bot."""
         try:
@@ -483,18 +795,21 @@ async def main():
                 write_stream,
                 mcp_server.create_initialization_options()
             )
+        
+        # MCP client disconnected - stop the bot so the task group can exit
+        await bot.close()
     
-    # Run both tasks concurrently
+    # Run both tasks concurrently; if either fails, the other is cancelled
     try:
-        await asyncio.gather(
-            start_bot(),
-            run_mcp()
-        )
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(start_bot())
+            tg.create_task(run_mcp())
     except KeyboardInterrupt:
         print("Shutting down...")
     finally:
         if not bot.is_closed():
             await bot.close()
+        await connector.close()
 
 
 if __name__ == "__main__":
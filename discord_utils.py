@@ -3,26 +3,196 @@ Discord Utilities
 Handles standardization and resolution of Discord objects (servers, channels, users).
 """
 
+from collections import OrderedDict
 from typing import Optional, Union
+import asyncio
 import discord
 import re
 
+from cachetools import TTLCache
+
+
+# Maximum number of unknown user IDs remembered by DiscordResolver.fetch_user
+_MISSING_USER_CACHE_SIZE = 4096
+# Limits concurrent fetch_user REST calls, so a message full of raw IDs
+# can't fire a burst of requests and get the bot rate limited
+_FETCH_SEM = asyncio.Semaphore(5)
+
+# Local aliases for discord classes checked on hot paths (skips the attribute lookup)
+_TextChannel = discord.TextChannel
+_NotFound = discord.NotFound
+
+# Mention patterns, compiled once at import
+_MENTION_RE = re.compile(r'<@!?(\d+)>')  # <@id> or <@!id>
+_ROLE_MENTION_RE = re.compile(r'<@&(\d+)>')
+_CHANNEL_MENTION_RE = re.compile(r'<#(\d+)>')
+_AT_RE = re.compile(r'@([a-zA-Z0-9_\.]+)')  # @username or @id
+# Standalone 17-20 digit numbers that aren't already in <@id> format
+_RAW_ID_RE = re.compile(r'(?<![<@\w])(\d{17,20})(?![>\w])')
+
 
 class DiscordResolver:
     """Handles resolution of Discord names/IDs to objects."""
     
     def __init__(self, bot):
         self.bot = bot
+        # Bounded, expiring caches so renamed or removed objects age out
         self._cache = {
-            "servers": {},  # name -> id
-            "channels": {},  # name -> id
-            "users": {}  # username -> id
+            "servers": TTLCache(maxsize=1024, ttl=300),  # name -> id
+            "channels": TTLCache(maxsize=4096, ttl=300),  # name -> id
+            "users": TTLCache(maxsize=8192, ttl=600)  # username -> id
         }
+        # Name indexes, built once the bot is ready and kept current by gateway events
+        self._indexed = False
+        self._guild_index = {}  # lowercased name -> [guild id]
+        self._channel_index = {}  # lowercased name -> [TextChannel]
+        self._user_index = {}  # lowercased username or global name -> [user id]
+        # user id -> in-flight fetch_user task, shared by concurrent lookups
+        self._user_tasks = {}
+        self._missing_users = OrderedDict()  # user ids known not to exist, oldest first
+    
+    async def _fetch_user_limited(self, user_id: int) -> discord.User:
+        """Fetch a user over REST, holding a slot of the shared fetch semaphore."""
+        async with _FETCH_SEM:
+            return await self.bot.fetch_user(user_id)
+    
+    async def fetch_user(self, user_id: int) -> Optional[discord.User]:
+        """
+        Fetch a user by ID, from the bot's user cache when possible.
+        Otherwise concurrent callers share one in-flight request. Results are
+        not kept here - callers' own expiring caches hold on to names.
+        Returns None if no user with this ID exists. IDs that Discord reported
+        as unknown are remembered, so they don't cost a request every time.
+        """
+        user = self.bot.get_user(user_id)
+        if user:
+            return user
+        
+        if user_id in self._missing_users:
+            return None
+        
+        task = self._user_tasks.get(user_id)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_user_limited(user_id))
+            
+            def forget(done):
+                if not done.cancelled():
+                    done.exception()  # Mark retrieved even if every caller went away
+                if self._user_tasks.get(user_id) is done:
+                    del self._user_tasks[user_id]
+            
+            task.add_done_callback(forget)
+            self._user_tasks[user_id] = task
+        
+        # Shield so one caller being cancelled doesn't cancel the shared fetch
+        try:
+            return await asyncio.shield(task)
+        except _NotFound:
+            self._missing_users[user_id] = None
+            if len(self._missing_users) > _MISSING_USER_CACHE_SIZE:
+                self._missing_users.popitem(last=False)
+            return None
+    
+    def build_index(self):
+        """Index every guild and text channel by lowercased name."""
+        self._guild_index = {}
+        self._channel_index = {}
+        self._user_index = {}
+        for guild in self.bot.guilds:
+            self.add_guild(guild)
+        self._indexed = True
+    
+    def _index_guild_name(self, guild: discord.Guild):
+        self._guild_index.setdefault(guild.name.lower(), []).append(guild.id)
+    
+    def _unindex_guild_name(self, guild: discord.Guild):
+        entries = self._guild_index.get(guild.name.lower())
+        if entries and guild.id in entries:
+            entries.remove(guild.id)
+            if not entries:
+                del self._guild_index[guild.name.lower()]
+    
+    def rename_guild(self, before: discord.Guild, after: discord.Guild):
+        """Move a renamed guild to its new name. Its channels and members are unaffected."""
+        self._unindex_guild_name(before)
+        self._index_guild_name(after)
+    
+    def add_guild(self, guild: discord.Guild):
+        """Add a guild, its text channels and its members to the name indexes."""
+        self._index_guild_name(guild)
+        for channel in guild.text_channels:
+            self.add_channel(channel)
+        for member in guild.members:
+            self.add_user(member)
+    
+    def remove_guild(self, guild: discord.Guild):
+        """Drop a guild, its text channels and members not seen elsewhere from the name indexes."""
+        self._unindex_guild_name(guild)
+        for channel in guild.text_channels:
+            self.remove_channel(channel)
+        for member in guild.members:
+            self.remove_member(member)
+    
+    def refresh_guild(self, guild: discord.Guild):
+        """
+        Re-index a guild whose state discord.py rebuilt, e.g. when it becomes
+        available again after an outage. Drops the old channel objects first.
+        """
+        for name, entries in list(self._guild_index.items()):
+            if guild.id in entries:
+                entries.remove(guild.id)
+                if not entries:
+                    del self._guild_index[name]
+        for name, entries in list(self._channel_index.items()):
+            entries[:] = [entry for entry in entries if entry.guild.id != guild.id]
+            if not entries:
+                del self._channel_index[name]
+        self.add_guild(guild)
+    
+    def add_channel(self, channel):
+        """Add a text channel to the name index. Other channel types are ignored."""
+        if isinstance(channel, _TextChannel):
+            self._channel_index.setdefault(channel.name.lower(), []).append(channel)
+    
+    def remove_channel(self, channel):
+        """Drop a channel from the name index."""
+        entries = self._channel_index.get(channel.name.lower())
+        if not entries:
+            return
+        entries[:] = [entry for entry in entries if entry.id != channel.id]
+        if not entries:
+            del self._channel_index[channel.name.lower()]
+    
+    def add_user(self, user: discord.abc.User):
+        """Add a user to the name index under their username and global name."""
+        for name in (user.name, user.global_name):
+            if name:
+                entries = self._user_index.setdefault(name.lower(), [])
+                if user.id not in entries:
+                    entries.append(user.id)
+    
+    def remove_user(self, user: discord.abc.User):
+        """Drop a user's names from the name index, keeping other users with the same names."""
+        for name in (user.name, user.global_name):
+            entries = self._user_index.get(name.lower()) if name else None
+            if entries and user.id in entries:
+                entries.remove(user.id)
+                if not entries:
+                    del self._user_index[name.lower()]
+    
+    def remove_member(self, member: discord.Member):
+        """Drop a member who left a guild, unless they are still in another one."""
+        for guild in self.bot.guilds:
+            if guild.id != member.guild.id and guild.get_member(member.id):
+                return
+        self.remove_user(member)
     
     @staticmethod
     def is_snowflake(s: str) -> bool:
         """Check if a string looks like a Discord snowflake ID."""
-        return s.isdigit() and 17 <= len(s) <= 20
+        # Length first: it rules out almost every username without scanning it.
+        # isascii rejects digits like '²' that isdigit accepts but int() can't parse
+        return 17 <= len(s) <= 20 and s.isascii() and s.isdigit()
     
     @staticmethod
     def parse_target(target: str) -> tuple[Optional[str], str]:
@@ -52,20 +222,29 @@ class DiscordResolver:
             return (None, f"ERROR: '{server_input}' is not a valid server ID. No server with this ID exists.")
         
         # Check cache
-        if server_input.lower() in self._cache["servers"]:
-            guild = self.bot.get_guild(self._cache["servers"][server_input.lower()])
+        cached_id = self._cache["servers"].get(server_input.lower())
+        if cached_id is not None:
+            guild = self.bot.get_guild(cached_id)
+            if guild:
+                return (guild, None)
+        
+        # Check name index
+        for guild_id in self._guild_index.get(server_input.lower(), ()):
+            guild = self.bot.get_guild(guild_id)
             if guild:
+                self._cache["servers"][server_input.lower()] = guild.id
                 return (guild, None)
         
-        # Search by name
+        # Index miss - search live state by name, collecting names for the error in the same pass
+        available_servers = []
         for guild in self.bot.guilds:
             if guild.name.lower() == server_input.lower():
                 self._cache["servers"][server_input.lower()] = guild.id
                 return (guild, None)
+            available_servers.append(guild.name)
         
         # Provide helpful error with available servers
-        available_servers = [g.name for g in self.bot.guilds]
-        server_list = "\n".join([f"  • {name}" for name in available_servers])
+        server_list = "\n".join(f"  • {name}" for name in available_servers)
         return (None, f"ERROR: '{server_input}' is not a valid server name. Available servers:\n{server_list}\n\nUse the exact server name or use list_servers tool to see all servers with IDs.")
     
     async def resolve_channel(
@@ -80,7 +259,7 @@ class DiscordResolver:
         """
         if self.is_snowflake(channel_input):
             channel = self.bot.get_channel(int(channel_input))
-            if isinstance(channel, discord.TextChannel):
+            if isinstance(channel, _TextChannel):
                 return (channel, None)
             if channel is None:
                 return (None, f"ERROR: '{channel_input}' is not a valid channel ID. No channel with this ID exists.")
@@ -89,14 +268,19 @@ class DiscordResolver:
         
         # Check cache
         cache_key = f"{guild.id if guild else 'global'}:{channel_input.lower()}"
-        if cache_key in self._cache["channels"]:
-            channel = self.bot.get_channel(self._cache["channels"][cache_key])
+        cached_id = self._cache["channels"].get(cache_key)
+        if cached_id is not None:
+            channel = self.bot.get_channel(cached_id)
             if channel:
                 return (channel, None)
         
-        # Search by name
-        channels = list(guild.channels) if guild else list(self.bot.get_all_channels())
-        matches = [ch for ch in channels if isinstance(ch, discord.TextChannel) and ch.name.lower() == channel_input.lower()]
+        # Check name index, falling back to searching live state by name on a miss
+        matches = []
+        if self._indexed:
+            matches = [ch for ch in self._channel_index.get(channel_input.lower(), ()) if guild is None or ch.guild.id == guild.id]
+        if not matches:
+            channels = guild.channels if guild else self.bot.get_all_channels()
+            matches = [ch for ch in channels if isinstance(ch, _TextChannel) and ch.name.lower() == channel_input.lower()]
         
         if len(matches) == 0:
             if guild:
@@ -110,7 +294,7 @@ class DiscordResolver:
         
         # Multiple matches - need server context
         if not guild:
-            server_list = "\n".join([f"  • {ch.guild.name} → #{ch.name}" for ch in matches])
+            server_list = "\n".join(f"  • {ch.guild.name} → #{ch.name}" for ch in matches)
             return (None, f"ERROR: Multiple channels named '{channel_input}' found in different servers:\n{server_list}\n\nYou MUST specify which server using format 'ServerName/{channel_input}' or use the channel ID.")
         
         return (None, f"ERROR: Unexpected situation - multiple channels with same name in one server")
@@ -127,27 +311,39 @@ class DiscordResolver:
         
         if self.is_snowflake(user_input):
             try:
-                user = await self.bot.fetch_user(int(user_input))
-                return (user, None)
-            except discord.NotFound:
+                user = await self.fetch_user(int(user_input))
+                if user:
+                    return (user, None)
                 return (None, f"ERROR: '{user_input}' is not a valid user ID. No user with this ID exists.")
             except Exception as e:
                 return (None, f"ERROR: Could not fetch user with ID '{user_input}': {str(e)}")
         
         # Check cache
-        if user_input.lower() in self._cache["users"]:
+        cached_id = self._cache["users"].get(user_input.lower())
+        if cached_id is not None:
             try:
-                user = await self.bot.fetch_user(self._cache["users"][user_input.lower()])
-                return (user, None)
+                user = await self.fetch_user(cached_id)
             except:
-                # Cache was stale, remove it
-                del self._cache["users"][user_input.lower()]
+                user = None
+            if user:
+                return (user, None)
+            # Cache was stale, remove it
+            self._cache["users"].pop(user_input.lower(), None)
         
-        # Search by username in all mutual guilds
+        # Check name index
+        for user_id in self._user_index.get(user_input.lower(), ()):
+            user = self.bot.get_user(user_id)
+            if user:
+                self._cache["users"][user_input.lower()] = user.id
+                return (user, None)
+        
+        # Index miss - search by username in all mutual guilds. Members loaded by
+        # gateway chunks after on_ready fire no event, so the index can lag behind.
         for guild in self.bot.guilds:
             for member in guild.members:
                 if member.name.lower() == user_input.lower() or \
                    (member.global_name and member.global_name.lower() == user_input.lower()):
+                    self.add_user(member)
                     self._cache["users"][user_input.lower()] = member.id
                     return (member, None)
         
@@ -157,48 +353,106 @@ class DiscordResolver:
 class MentionProcessor:
     """Handles conversion of mentions between Discord format and human-readable format."""
     
-    def __init__(self, bot):
+    def __init__(self, bot, resolver: Optional[DiscordResolver] = None):
         self.bot = bot
+        # Shared resolver, so its caches and indexes serve every lookup
+        self.resolver = resolver or DiscordResolver(bot)
+        # user id -> username; expiring, since users fetched over REST get no update events
+        self._name_cache = TTLCache(maxsize=8192, ttl=600)
+        # (guild id, user id) pairs that bulk_prefetch's member query didn't return
+        self._not_in_guild = TTLCache(maxsize=8192, ttl=600)
+    
+    def remember_user(self, user: discord.abc.User):
+        """Record a user's current name for humanize_mentions."""
+        self._name_cache[user.id] = user.name
     
-    async def humanize_mentions(self, message: str) -> str:
+    async def bulk_prefetch(self, messages: list[str], guild: Optional[discord.Guild]):
+        """
+        Load every member mentioned across a batch of messages into the guild's
+        member cache in as few gateway requests as possible, so that
+        humanize_mentions can resolve them without a REST call each.
+        """
+        if guild is None:
+            return
+        
+        # Skip users whose names are already known, and ones an earlier query
+        # showed aren't in this guild (e.g. members who left)
+        user_ids = {int(user_id) for message in messages for user_id in _MENTION_RE.findall(message)} - self._name_cache.keys()
+        missing = [
+            user_id for user_id in user_ids
+            if guild.get_member(user_id) is None and (guild.id, user_id) not in self._not_in_guild
+        ]
+        
+        # Gateway member queries accept at most 100 IDs each
+        for i in range(0, len(missing), 100):
+            batch = missing[i:i + 100]
+            try:
+                members = await guild.query_members(user_ids=batch, limit=100, cache=True)
+            except (asyncio.TimeoutError, discord.ClientException):
+                # Not fatal - humanize_mentions falls back to fetching users individually
+                return
+            found = {member.id for member in members}
+            for user_id in batch:
+                if user_id not in found:
+                    self._not_in_guild[(guild.id, user_id)] = True
+    
+    async def humanize_mentions(self, message: str, guild: Optional[discord.Guild] = None) -> str:
         """
         Convert Discord mention format <@id> back to readable @username.
         This makes message history understandable for LLMs.
+        If guild is provided, its member cache is checked before fetching users.
         
         Handles:
         - <@123456789> -> @username
         - <@!123456789> -> @username (nickname format)
+        - <@&123456789> -> @rolename (when guild is provided)
+        - <#123456789> -> #channel
         
         Returns the message with human-readable mentions.
         """
-        # Pattern for Discord mentions: <@id> or <@!id>
-        pattern = r'<@!?(\d+)>'
+        # Every mention format starts with '<' - plain text needs no work
+        if '<' not in message:
+            return message
         
-        async def replace_mention(match):
-            user_id = match.group(1)
+        async def lookup_user(user_id):
+            # Check the guild member cache first
+            if guild:
+                member = guild.get_member(user_id)
+                if member:
+                    return member
             
             # Try to fetch the user
             try:
-                user = await self.bot.fetch_user(int(user_id))
-                if user:
-                    return f"@{user.name}"
+                return await self.resolver.fetch_user(user_id)
             except:
-                pass
-            
+                return None
+        
+        # Resolve names for any mentioned users we haven't seen yet, concurrently
+        unseen = {int(user_id) for user_id in _MENTION_RE.findall(message)} - self._name_cache.keys()
+        for user in await asyncio.gather(*(lookup_user(user_id) for user_id in unseen)):
+            if user:
+                self.remember_user(user)
+        
+        def replace_user(match):
+            name = self._name_cache.get(int(match.group(1)))
             # If can't fetch, leave the ID but make it readable
-            return f"@[{user_id}]"
-        
-        # Replace all mentions
-        parts = []
-        last_end = 0
-        for match in re.finditer(pattern, message):
-            parts.append(message[last_end:match.start()])
-            replacement = await replace_mention(match)
-            parts.append(replacement)
-            last_end = match.end()
-        parts.append(message[last_end:])
-        
-        return ''.join(parts)
+            return f"@{name}" if name else f"@[{match.group(1)}]"
+        
+        def replace_role(match):
+            role = guild.get_role(int(match.group(1)))
+            return f"@{role.name}" if role else match.group(0)
+        
+        def replace_channel(match):
+            # Private channels (DMs) have no name - leave those mentions as-is
+            name = getattr(self.bot.get_channel(int(match.group(1))), "name", None)
+            return f"#{name}" if name else match.group(0)
+        
+        message = _MENTION_RE.sub(replace_user, message)
+        if guild:
+            message = _ROLE_MENTION_RE.sub(replace_role, message)
+        message = _CHANNEL_MENTION_RE.sub(replace_channel, message)
+        
+        return message
     
     async def process_mentions(
         self, 
@@ -217,64 +471,42 @@ class MentionProcessor:
         Returns the message with properly formatted mentions.
         """
         # Pattern 1: @username or @id
-        pattern_at = r'@([a-zA-Z0-9_\.]+)'
-        
-        async def replace_at_mention(match):
-            username = match.group(1)
-            
+        async def resolve_at_mention(username):
             # If it's already a snowflake ID, just format it
             if DiscordResolver.is_snowflake(username):
                 return f"<@{username}>"
             
             # Otherwise, look up the user
-            resolver = DiscordResolver(self.bot)
-            user, error = await resolver.resolve_user(username)
-            if user:
+            user, _ = await self.resolver.resolve_user(username)
+            if user is not None:
                 return f"<@{user.id}>"
             
             # If not found, leave as-is (will be plain text)
-            return match.group(0)
-        
-        # Replace all @mentions
-        parts = []
-        last_end = 0
-        for match in re.finditer(pattern_at, message):
-            parts.append(message[last_end:match.start()])
-            replacement = await replace_at_mention(match)
-            parts.append(replacement)
-            last_end = match.end()
-        parts.append(message[last_end:])
-        message = ''.join(parts)
+            return None
+        
+        # Resolve each distinct @mention once, concurrently, then replace them all
+        if '@' in message:
+            usernames = list({match.group(1) for match in _AT_RE.finditer(message)})
+            replacements = await asyncio.gather(*(resolve_at_mention(username) for username in usernames))
+            table = {username: mention for username, mention in zip(usernames, replacements) if mention}
+            message = _AT_RE.sub(lambda match: table.get(match.group(1), match.group(0)), message)
         
         # Pattern 2: Raw snowflake IDs that aren't already in <@id> format
         # Look for standalone numbers that are 17-20 digits and might be user IDs
         # Only convert if they're isolated (surrounded by spaces or at start/end)
-        pattern_raw = r'(?<![<@\w])(\d{17,20})(?![>\w])'
-        
-        async def replace_raw_id(match):
-            user_id = match.group(1)
-            
-            # Check if this is actually a user ID by trying to fetch
-            try:
-                user = await self.bot.fetch_user(int(user_id))
-                if user:
-                    return f"<@{user_id}>"
-            except:
-                pass
-            
+        user_ids = list({match.group(1) for match in _RAW_ID_RE.finditer(message)})
+        if user_ids:
+            # Check which candidates are actually users, all at once
+            users = await asyncio.gather(
+                *(self.resolver.fetch_user(int(user_id)) for user_id in user_ids),
+                return_exceptions=True
+            )
             # If not a valid user, leave as-is
-            return match.group(0)
-        
-        # Only process raw IDs if there are isolated numbers that look like IDs
-        if re.search(pattern_raw, message):
-            parts = []
-            last_end = 0
-            for match in re.finditer(pattern_raw, message):
-                parts.append(message[last_end:match.start()])
-                replacement = await replace_raw_id(match)
-                parts.append(replacement)
-                last_end = match.end()
-            parts.append(message[last_end:])
-            message = ''.join(parts)
+            table = {
+                user_id: f"<@{user_id}>"
+                for user_id, user in zip(user_ids, users)
+                if user and not isinstance(user, BaseException)
+            }
+            message = _RAW_ID_RE.sub(lambda match: table.get(match.group(1), match.group(0)), message)
         
         return message
\ No newline at end of file